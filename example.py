@@ -16,6 +16,13 @@ from pn532 import PN532Uart
 DEBUG = False
 
 
+async def configure(rf):
+    await rf.SAM_configuration()
+    # Have the PN532 give up after a limited number of attempts so read_passive_target
+    # returns None instead of waiting forever for a card.
+    await rf.set_passive_activation_retries(0x10)
+
+
 async def test():
     buzzer = machine.Pin(21, machine.Pin.OUT)
     buzzer.off()
@@ -29,18 +36,29 @@ async def test():
     ic, ver, rev, support = await rf.get_firmware_version()
     print('Found PN532 with firmware version: {0}.{1}'.format(ver, rev))
 
+    configured = False
     while True:
+        # NOTE: The PN532 returns on its own when no card is found. The timeout is a
+        #       watchdog for a lost exchange (ie the PN532 reset), after which the
+        #       PN532 is woken and configured again.
         try:
+            if not configured:
+                await asyncio.wait_for(configure(rf), timeout=1.0)
+                configured = True
             uid = await asyncio.wait_for(rf.read_passive_target(), timeout=1.0)
+        except (asyncio.TimeoutError, RuntimeError):
+            rf.sleep()
+            configured = False
+            print('PN532 not responding!')
+            continue
+
+        if uid is None:
+            continue
+        if DEBUG:
             print("Card UUID: ", [hex(i) for i in uid])
-            buzzer.on()
-            await asyncio.sleep(0.2)
-            buzzer.off()
-        except asyncio.TimeoutError:
-            # NOTE: This is important to stop the reader from reporting cards after
-            #       we are no longer waiting.
-            await rf.release_targets()
-            print('timeout!')
+        buzzer.on()
+        await asyncio.sleep(0.2)
+        buzzer.off()
 
 
 loop = asyncio.get_event_loop()
@@ -11,6 +11,7 @@ _WAKEUP                        = b'\x55\x55\x00\x00\x00\x00\x00\x00\x00\x00\x00\
 _COMMAND_GETFIRMWAREVERSION    = const(0x02)
 _COMMAND_INLISTPASSIVETARGET   = const(0x4A)
 _COMMAND_INRELEASE             = const(0x52)
+_COMMAND_RFCONFIGURATION       = const(0x32)
 _COMMAND_SAMCONFIGURATION      = const(0x14)
 
 # Send Frames
@@ -23,10 +24,22 @@ _POSTAMBLE                     = const(0x00)
 _HOSTTOPN532                   = const(0xD4)
 _PN532TOHOST                   = const(0xD5)
 _ACK                           = b'\x00\x00\xFF\x00\xFF\x00'
-_FRAME_START                   = b'\x00\x00\xFF'
+# Frame start (0x00, 0x00, 0xFF) + length + length checksum
+_HEADER_LEN                    = const(5)
+# Frame start + header (5), up to 255 data bytes, checksum + postamble (2)
+_MAX_FRAME_LEN                 = const(262)
 
 # Codes
 _MIFARE_ISO14443A              = const(0x00)
+_RFCONFIG_MAXRETRIES           = const(0x05)
+
+# Response data lengths (TFI + command + payload) for commands with a fixed size reply
+_RESPONSE_LENGTHS = {
+    _COMMAND_GETFIRMWAREVERSION: 6,
+    _COMMAND_INRELEASE: 3,
+    _COMMAND_RFCONFIGURATION: 2,
+    _COMMAND_SAMCONFIGURATION: 2,
+}
 
 class PN532Uart(object):
     """
@@ -39,12 +52,32 @@ class PN532Uart(object):
             self.uart = machine.UART(uart_no, baudrate=115200)
         
         self.debug = debug
+        self._awake = False
         self.swriter = asyncio.StreamWriter(self.uart, {})
         self.sreader = asyncio.StreamReader(self.uart)
-    
-    async def _write_frame(self, data):
-        """Write a frame to the PN532 with the specified data bytearray."""
-        assert data is not None and 1 < len(data) < 255, 'Data must be array of 1 to 255 bytes.'
+        # StreamReader.readinto is missing from older uasyncio releases, so fall back to read() there.
+        self._has_readinto = hasattr(self.sreader, 'readinto')
+        self._rx_buf = bytearray(_MAX_FRAME_LEN)
+        self._tx_buf = bytearray(_MAX_FRAME_LEN)
+
+        # Frames for the commands sent with fixed parameters never change, so build them once.
+        self._frames = {}
+        for command, params in ((_COMMAND_SAMCONFIGURATION, (0x01, 0x14, 0x01)),
+                                (_COMMAND_INRELEASE, (0x00,))):
+            self._frames[(command, params)] = bytes(self._build_frame(bytes((_HOSTTOPN532, command) + params)))
+        # read_passive_target bypasses call_function, so its frame is kept separately.
+        self._inlist_frame = bytes(self._build_frame(
+            bytes((_HOSTTOPN532, _COMMAND_INLISTPASSIVETARGET, 0x01, _MIFARE_ISO14443A))))
+
+    @staticmethod
+    def _build_frame(data, buf=None):
+        """
+        Build and return the complete frame wrapping the specified data. The frame is
+        built in (a view of) buf if given, otherwise in a new bytearray.
+        """
+        length = len(data)
+        if length < 2 or length > 254:
+            raise ValueError('Data must be array of 2 to 254 bytes.')
 
         # Build frame to send as:
         # - Preamble (0x00)
@@ -54,93 +87,150 @@ class PN532Uart(object):
         # - Command bytes
         # - Checksum
         # - Postamble (0x00)
-        length = len(data)
-        frame = bytearray(length+8)
+        if buf is None:
+            frame = bytearray(length+7)
+        else:
+            frame = memoryview(buf)[:length+7]
         frame[0] = _PREAMBLE
         frame[1] = _STARTCODE1
         frame[2] = _STARTCODE2
-        checksum = sum(frame[0:3])
         frame[3] = length & 0xFF
-        frame[4] = (~length + 1) & 0xFF
+        frame[4] = (-length) & 0xFF
         frame[5:-2] = data
-        checksum += sum(data)
+        # The preamble and start code always sum to 0xFF, so only the data needs summing.
+        checksum = 0xFF + sum(memoryview(frame)[5:-2])
         frame[-2] = ~checksum & 0xFF
         frame[-1] = _POSTAMBLE
-        
-        # Send frame.
-        if self.debug:
-            print('_write_frame: ', [hex(i) for i in frame])
+        return frame
 
+    async def _write_frame(self, frame, _WAKEUP=_WAKEUP, _ACK=_ACK):
+        """Write a prebuilt frame (see _build_frame) to the PN532 and wait for the ACK."""
         # HACK! Timeouts can cause there to be data in the read buffer that was for an old command (ie read_passive_target).
-        # Additonally, the device needs to be woken sometimes, and it seems safe to do that before every command.
-        # TODO: Does WAKEUP cancel the passive read_command?
         # Before sending the real command, clear the read buffer
-        await self.swriter.awrite(_WAKEUP)
+        junk = self.uart.read()
 
-        waiting = self.uart.any()
-        while waiting > 0:
-            if self.debug:
-                print("Removing %d bytes in the read buffer")
-            self.uart.read(waiting)
-            waiting = self.uart.any()
+        # The device needs to be woken after a reset or power down, but stays awake once configured.
+        # The wakeup is sent in the same write as the frame. Note: awrite() also drains the writer.
+        # If the exchange fails or is cancelled the device may have reset, so wake it again next time.
+        try:
+            if not self._awake:
+                await self.swriter.awrite(_WAKEUP + frame)
+            else:
+                await self.swriter.awrite(frame)
 
-        await self.swriter.awrite(bytes(frame))
-        await self.swriter.drain()
+            ack = await self.sreader.readexactly(len(_ACK))
+        except BaseException:
+            self._awake = False
+            raise
 
-        ack = await self.sreader.read(len(_ACK))
+        # Debug output is only printed once the exchange is complete so it can't delay the PN532.
         if self.debug:
-            print('_write_frame: ACK: ', [hex(i) for i in ack])
+            if junk:
+                print("Removed %d bytes from the read buffer" % len(junk))
+            self._log('_write_frame: ', frame)
+            self._log('_write_frame: ACK: ', ack)
         if ack != _ACK:
+            self._awake = False
             raise RuntimeError('Did not receive expected ACK from PN532!')
 
-    async def _read_frame(self):
+        # Only trust that the device is awake once it has acknowledged a command.
+        self._awake = True
+
+    def _log(self, label, buf):
+        """Print the label followed by the bytes in buf as hex. Only call when self.debug is set."""
+        print(label, [hex(i) for i in buf])
+
+    async def _readinto(self, buf, n, minimum):
+        """
+        Read from the uart into buf (a memoryview), starting at offset n, until at least
+        minimum bytes are in buf. Reads never go past the end of buf. Returns the new offset.
+        """
+        while n < minimum:
+            if self._has_readinto:
+                count = await self.sreader.readinto(buf[n:])
+            else:
+                chunk = await self.sreader.read(len(buf) - n)
+                count = len(chunk) if chunk else 0
+                if count:
+                    buf[n:n+count] = chunk
+            if not count:
+                raise RuntimeError('No data received from PN532!')
+            n += count
+        return n
+
+    async def _read_frame(self, data_len=None):
         """
         Read a response frame from the PN532 and return the data inside the frame,
         otherwise raises an exception if there is an error parsing the frame.
+        If the length of the frame data is known up front the whole frame is requested in one read.
         """
-        # Read the Frame start and header
-        response = await self.sreader.read(len(_FRAME_START)+2)
+        try:
+            return await self._read_frame_data(data_len)
+        except BaseException:
+            # A failed or cancelled response leaves the device state unknown, so wake it again next time.
+            self._awake = False
+            raise
+
+    async def _read_frame_data(self, data_len):
+        """Read and validate a response frame. See _read_frame."""
+        buf = memoryview(self._rx_buf)
+        # Read the Frame start and header. If the data length is known, ask for the complete
+        # frame (header, data, checksum & end frame) at once, but only wait for the header as
+        # the actual reply (ie an error frame) may be shorter.
+        if data_len is not None:
+            n = await self._readinto(buf[:_HEADER_LEN+data_len+2], 0, _HEADER_LEN)
+        else:
+            n = await self._readinto(buf[:_HEADER_LEN], 0, _HEADER_LEN)
         if self.debug:
-            print('_read_frame: frame_start + header:', [hex(i) for i in response])
+            self._log('_read_frame: frame_start + header:', buf[:_HEADER_LEN])
 
-        if len(response) < (len(_FRAME_START) + 2) or response[:-2] != _FRAME_START:
-            raise RuntimeError('Response does not begin with _FRAME_START!')
+        if buf[0] != _PREAMBLE or buf[1] != _STARTCODE1 or buf[2] != _STARTCODE2:
+            raise RuntimeError('Response does not begin with the frame start!')
         
         # Read the header (length & length checksum) and make sure they match.
-        frame_len = response[-2]
-        frame_checksum = response[-1]
+        frame_len = buf[_HEADER_LEN-2]
+        frame_checksum = buf[_HEADER_LEN-1]
         if (frame_len + frame_checksum) & 0xFF != 0:
             raise RuntimeError('Response length checksum did not match length!')
 
-        # read the frame (data + data checksum + end frame) & validate
-        data = await self.sreader.read(frame_len+2)
+        # read the rest of the frame (data + data checksum + end frame) & validate
+        frame_end = _HEADER_LEN + frame_len + 2
+        if n < frame_end:
+            await self._readinto(buf[:frame_end], n, frame_end)
+        data = buf[_HEADER_LEN:frame_end]
         if self.debug:
-            print('_read_frame: data: ', [hex(i) for i in data])
+            self._log('_read_frame: data: ', data)
+        if data_len is not None and frame_len != data_len:
+            raise RuntimeError('Response length did not match expected length!')
     
-        checksum = sum(data) & 0xFF
+        # The data, its checksum and the frame end (0x00) must all sum to zero, so a
+        # single sum validates both the data checksum and the frame end.
+        checksum = (sum(data) & 0xFF) | data[-1]
         if checksum != 0:
-            raise RuntimeError('Response checksum did not match expected value: ', checksum)
-
-        if data[-1] != 0x00:
-            raise RuntimeError('Response does not include Frame End')
+            raise RuntimeError('Response checksum or Frame End did not match expected value: ', checksum)
 
-        # Return frame data.
+        # Return frame data (a view into the receive buffer, valid until the next read).
         return data[0:frame_len]
 
-    async def call_function(self, command, params=[]):
+    async def call_function(self, command, params=b''):
         """
         Send specified command to the PN532 and return the response.
-        Note: There is no timeout option. Use async.wait_for(function(), timeout) instead
+        The response is a memoryview that is only valid until the next command is sent.
+        Note: There is no timeout option. Use asyncio.wait_for(function(), timeout) instead.
+        If the call fails or is cancelled the PN532 may still be busy (or have reset), so the
+        next command is preceded by a wakeup to recover it.
         """
-        data = bytearray(2 + len(params))
-        data[0] = _HOSTTOPN532
-        data[1] = command & 0xFF
-        for i, val in enumerate(params):
-            data[2+i] = val
+        frame = self._frames.get((command, tuple(params)))
+        if frame is None:
+            data = bytearray(2 + len(params))
+            data[0] = _HOSTTOPN532
+            data[1] = command & 0xFF
+            data[2:] = params if isinstance(params, (bytes, bytearray)) else bytes(params)
+            frame = self._build_frame(data, self._tx_buf)
         
         # Send the frame and read the response
-        await self._write_frame(data)
-        response = await self._read_frame()
+        await self._write_frame(frame)
+        response = await self._read_frame(_RESPONSE_LENGTHS.get(command))
 
         if len(response) < 2:
             raise RuntimeError('Received smaller than expected frame')
@@ -155,9 +245,9 @@ class PN532Uart(object):
         if self.debug:
             print("Sending SAM_CONFIGURATION")
 
-        response = await self.call_function(_COMMAND_SAMCONFIGURATION, params=[0x01, 0x14, 0x01])
+        response = await self.call_function(_COMMAND_SAMCONFIGURATION, b'\x01\x14\x01')
         if self.debug:
-            print('SAM_configuration:', [hex(i) for i in response])
+            self._log('SAM_configuration:', response)
 
     async def get_firmware_version(self):
         """
@@ -167,7 +257,7 @@ class PN532Uart(object):
         if self.debug:
             print("Sending GET_FIRMWARE_VERSION")
 
-        response = await self.call_function(_COMMAND_GETFIRMWAREVERSION)
+        response = await self.call_function(_COMMAND_GETFIRMWAREVERSION, b'')
         if response is None:
             raise RuntimeError('Failed to detect the PN532')
         return tuple(response)
@@ -175,24 +265,57 @@ class PN532Uart(object):
     async def read_passive_target(self, card_baud=_MIFARE_ISO14443A):
         """
         Wait for a MiFare card to be available and return its UID when found.
-        Will wait up to timeout seconds and return None if no card is found,
-        otherwise a bytearray with the UID of the found card is returned.
+        Returns None if the PN532 gives up without finding a card (see
+        set_passive_activation_retries), otherwise the bytes of the found card's UID.
         """
         if self.debug:
             print("Sending INIT_PASSIVE_TARGET")
         # Send passive read command for 1 card.  Expect at most a 7 byte UUID.
-        response = await self.call_function(_COMMAND_INLISTPASSIVETARGET, params=[0x01, card_baud])
+        # This is the polling hot path so it writes the frame and parses the response directly.
+        if card_baud == _MIFARE_ISO14443A:
+            frame = self._inlist_frame
+        else:
+            frame = self._build_frame(bytes((_HOSTTOPN532, _COMMAND_INLISTPASSIVETARGET, 0x01, card_baud)), self._tx_buf)
+        await self._write_frame(frame)
+        response = await self._read_frame()
+
+        # Response is: TFI, command + 1, NbTg, Tg, SENS_RES (2 bytes), SEL_RES, UID length, UID
+        if len(response) < 3 or response[0] != _PN532TOHOST or response[1] != _COMMAND_INLISTPASSIVETARGET + 1:
+            raise RuntimeError('Received unexpected command response!')
+
+        # No card was found before the retries ran out.
+        if response[2] == 0x00:
+            return None
 
         # Check only 1 card with up to a 7 byte UID is present.
-        if response[0] != 0x01:
+        if response[2] != 0x01:
             raise RuntimeError('More than one card detected!')
-        if response[5] > 7:
+        if len(response) < 8:
+            raise RuntimeError('Received smaller than expected frame')
+        if response[7] > 7:
             raise RuntimeError('Found card with unexpectedly long UID!')
 
-        # Return UID of card.
-        return response[6:6+response[5]]
+        # Return UID of card. Copied as the response buffer is reused by the next command.
+        return bytes(response[8:8+response[7]])
+
+    async def set_passive_activation_retries(self, retries=0xFF):
+        """
+        Set how many times the PN532 retries activating a card before
+        read_passive_target returns None. 0xFF (the default) retries forever.
+        """
+        if self.debug:
+            print("Sending RF_CONFIGURATION")
+        # Config item is MaxRetries: MxRtyATR, MxRtyPSL, MxRtyPassiveActivation
+        await self.call_function(_COMMAND_RFCONFIGURATION, bytes((_RFCONFIG_MAXRETRIES, 0xFF, 0x01, retries)))
 
     async def release_targets(self):
         if self.debug:
             print("Release Targets")
-        response = await self.call_function(_COMMAND_INRELEASE, params=[0x00])
+        response = await self.call_function(_COMMAND_INRELEASE, b'\x00')
+
+    def sleep(self):
+        """
+        Mark the PN532 as asleep (ie after a reset or power down) so that the
+        next command is preceded by a wakeup sequence.
+        """
+        self._awake = False